@@ -1,66 +1,426 @@
 #!/usr/bin/env python
 # -*- coding: utf-8 -*-
 
+import asyncio
+import atexit
+import contextvars
+import hashlib
+import logging
+import queue
+import shelve
+import sys
+import threading
+import time
+from collections import OrderedDict, namedtuple
+from concurrent.futures import Future
 from functools import update_wrapper
+from inspect import iscoroutinefunction
+from logging.handlers import QueueHandler, QueueListener
 
+CacheInfo = namedtuple("CacheInfo", "hits misses maxsize currsize")
 
-def disable(func):
+_kwargs_mark = object()
+_clock = time.monotonic
+
+# trace пишет через очередь, в stdout ее разбирает отдельный поток
+_trace_queue = queue.SimpleQueue()
+_trace_handler = logging.StreamHandler(sys.stdout)
+_trace_handler.setFormatter(logging.Formatter("%(message)s"))
+_trace_listener = QueueListener(_trace_queue, _trace_handler)
+_trace_listener_lock = threading.Lock()
+_trace_listener_started = False
+_trace_log = logging.getLogger("deco.trace")
+_trace_log.addHandler(QueueHandler(_trace_queue))
+_trace_log.setLevel(logging.INFO)
+_trace_log.propagate = False
+
+
+def disable(func=None, **kwargs):
     '''
     Disable a decorator by re-assigning the decorator's name
     to this function. For example, to turn off memoization:
 
     >>> memo = disable
+
+    Keyword options are accepted and ignored, so @memo(maxsize=128)
+    keeps working too.
     '''
-    @decorator(func)
-    def wrapper(*args, **kwargs):
-        return func(*args, **kwargs)
-    return wrapper
+    if func is None:
+        return disable
+    return func
 
 
-def decorator(dec):
+def decorator(wrapped):
     '''
     Decorate a decorator so that it inherits the docstrings
-    and stuff from the function it's decorating.
+    and stuff from the function it's decorating:
+
+    @decorator(func)
+    def wrapper(*args):
+        ....
+
+    The wrapper itself gets the metadata of the wrapped function, including
+    a copy of its __dict__, and is returned as is: no extra call layer is
+    added. Stacked decorators rely on that copy to expose attributes of
+    inner ones (e.g. memo's cache_info under countcalls); note that plain
+    values such as countcalls' calls are copied once and do not update.
     '''
-    def decorated(func):
-        def wrapper(*args, **kwargs):
-            return func(*args, **kwargs)
-        update_wrapper(wrapper, decorated)
-        return wrapper
-    update_wrapper(decorated, dec)
+    def decorated(wrapper):
+        return update_wrapper(wrapper, wrapped)
     return decorated
 
 
 def countcalls(func):
-    '''Decorator that counts calls made to the function decorated.'''
+    '''Decorator that counts calls made to the function decorated.
+    The counter is updated under a lock, so it is safe for threads.'''
 
-    @decorator(func)
-    def wrapper(*args):
-        wrapper.calls += 1
-        return func(*args)
+    lock = threading.Lock()
+
+    if iscoroutinefunction(func):
+        @decorator(func)
+        async def wrapper(*args, **kwargs):
+            with lock:
+                wrapper.calls += 1
+            return await func(*args, **kwargs)
+    else:
+        @decorator(func)
+        def wrapper(*args, **kwargs):
+            with lock:
+                wrapper.calls += 1
+            return func(*args, **kwargs)
     wrapper.calls = 0
     return wrapper
 
 
-def memo(func):
+def memo(func=None, *, maxsize=None, policy="lru", ttl=None):
     '''
     Memoize a function so that it caches all return values for
     faster future lookups.
+
+    Can be used bare (@memo) or with keyword options:
+
+    @memo(maxsize=128, policy="lfu", ttl=60)
+    def f(x):
+        ....
+
+    maxsize limits the number of cached results (None - unbounded),
+    policy selects what to evict when the cache is full ("lru" or "lfu"),
+    ttl sets how many seconds a result stays valid (None - forever).
+    Concurrent calls with the same arguments compute the result only once,
+    for coroutine functions concurrent awaits share one computation.
+    Calls with unhashable arguments are not cached.
     '''
-    cache = dict()
+    if func is None:
+        return lambda func: memo(func, maxsize=maxsize, policy=policy, ttl=ttl)
+    if not callable(func):
+        raise TypeError("memo options must be passed as keywords, e.g. memo(maxsize=128)")
+    if policy not in ("lru", "lfu"):
+        raise ValueError(f"Unknown eviction policy: {policy}")
+
+    cache = OrderedDict()        # key -> value, least recently used first
+    expirations = OrderedDict()  # key -> expiration time, oldest first
+    freqs = {}                   # key -> number of uses (lfu)
+    buckets = {}                 # number of uses -> keys, least recently used first (lfu)
+    min_freq = 0
+    lock = threading.Lock()
+    stats = {"hits": 0, "misses": 0}
+
+    def bump(key):
+        nonlocal min_freq
+        freq = freqs[key]
+        bucket = buckets[freq]
+        del bucket[key]
+        if not bucket:
+            del buckets[freq]
+            if min_freq == freq:
+                min_freq = freq + 1
+        freqs[key] = freq + 1
+        buckets.setdefault(freq + 1, OrderedDict())[key] = None
+
+    def discard(key):
+        del cache[key]
+        expirations.pop(key, None)
+        if policy == "lfu":
+            freq = freqs.pop(key)
+            bucket = buckets[freq]
+            del bucket[key]
+            if not bucket:
+                del buckets[freq]
+
+    def evict():
+        nonlocal min_freq
+        if policy == "lru":
+            discard(next(iter(cache)))
+        else:
+            if min_freq not in buckets:
+                min_freq = min(buckets)
+            discard(next(iter(buckets[min_freq])))
+
+    def purge_expired():
+        now = _clock()
+        while expirations:
+            key, expires = next(iter(expirations.items()))
+            if expires > now:
+                break
+            discard(key)
+
+    def lookup(key):
+        if key not in cache:
+            return False, None
+        if ttl is not None and expirations[key] <= _clock():
+            discard(key)
+            return False, None
+        if policy == "lru":
+            cache.move_to_end(key)
+        else:
+            bump(key)
+        stats["hits"] += 1
+        return True, cache[key]
+
+    def store(key, value):
+        nonlocal min_freq
+        if maxsize is not None and maxsize <= 0:
+            return
+        if ttl is not None:
+            purge_expired()
+        if key in cache:
+            discard(key)
+        while maxsize is not None and len(cache) >= maxsize:
+            evict()
+        cache[key] = value
+        if ttl is not None:
+            expirations[key] = _clock() + ttl
+        if policy == "lfu":
+            freqs[key] = 1
+            buckets.setdefault(1, OrderedDict())[key] = None
+            min_freq = 1
+
+    if iscoroutinefunction(func):
+        pending = {}
+
+        async def compute(key, args, kwargs):
+            try:
+                value = await func(*args, **kwargs)
+                with lock:
+                    store(key, value)
+                return value
+            finally:
+                with lock:
+                    pending.pop(key, None)
+
+        @decorator(func)
+        async def wrapper(*args, **kwargs):
+            try:
+                key = _make_key(args, kwargs)
+            except TypeError:
+                return await func(*args, **kwargs)
+
+            with lock:
+                hit, value = lookup(key)
+                if hit:
+                    return value
+                task = pending.get(key)
+                if task is None:
+                    stats["misses"] += 1
+                    task = pending[key] = asyncio.ensure_future(compute(key, args, kwargs))
+                else:
+                    stats["hits"] += 1
+            return await asyncio.shield(task)
+    else:
+        wrapper = _sync_memo(func, lookup, store, lock, stats)
+
+    def cache_info():
+        with lock:
+            return CacheInfo(stats["hits"], stats["misses"], maxsize, len(cache))
+
+    def cache_clear():
+        with lock:
+            cache.clear()
+            expirations.clear()
+            freqs.clear()
+            buckets.clear()
+            stats["hits"] = stats["misses"] = 0
+
+    wrapper.cache_info = cache_info
+    wrapper.cache_clear = cache_clear
+    return wrapper
+
+
+def _make_key(args, kwargs):
+    '''Cache key for a call, raises TypeError for unhashable arguments.'''
+    key = args
+    if kwargs:
+        key += (_kwargs_mark,) + tuple(sorted(kwargs.items()))
+    hash(key)
+    return key
+
+
+def _sync_memo(func, lookup, store, lock, stats):
+    '''memo wrapper for a regular function, computes each key under its own lock.'''
+    key_locks = {}  # key -> [lock, number of callers using it]
 
     @decorator(func)
-    def wrapper(*args):
+    def wrapper(*args, **kwargs):
         try:
-            key = tuple(args)
-            if key not in cache:
-                cache[key] = func(*args)
-            return cache[key]
+            key = _make_key(args, kwargs)
         except TypeError:
-            return func(*args)
+            return func(*args, **kwargs)
+
+        with lock:
+            hit, value = lookup(key)
+            if hit:
+                return value
+            entry = key_locks.get(key)
+            if entry is None:
+                entry = key_locks[key] = [threading.RLock(), 0]
+            entry[1] += 1
+        try:
+            with entry[0]:
+                with lock:
+                    hit, value = lookup(key)
+                    if hit:
+                        return value
+                    stats["misses"] += 1
+                value = func(*args, **kwargs)
+                with lock:
+                    store(key, value)
+                return value
+        finally:
+            with lock:
+                entry[1] -= 1
+                if not entry[1]:
+                    del key_locks[key]
     return wrapper
 
 
+def disk_memo(filename):
+    '''
+    Memoize a function in a shelve file, so that results survive
+    process restarts:
+
+    @disk_memo("fib.cache")
+    def fib(n):
+        ....
+
+    Arguments must be built from None, bool, int, float, str, bytes,
+    tuples, lists, sets and dicts (see _stable_repr), results must be
+    picklable. The file is opened on the first call and closed at exit or
+    by cache_close(). All file access runs on one dedicated thread.
+    Only one process may use the file at a time.
+    Can be combined with memo to avoid hitting the disk on every call.
+    '''
+
+    def memoizer(func):
+        prefix = f"{func.__module__}.{func.__qualname__}"
+        io = _SerialExecutor(f"disk_memo-{func.__qualname__}")
+        shelf = None
+
+        def make_key(args, kwargs):
+            key = f"{prefix}:{_stable_repr(args)}:{_stable_repr(kwargs)}"
+            return hashlib.sha256(key.encode()).hexdigest()
+
+        def open_shelf():
+            nonlocal shelf
+            if shelf is None:
+                shelf = shelve.open(filename)
+                atexit.register(cache_close)
+            return shelf
+
+        def load(key):
+            db = open_shelf()
+            if key in db:
+                return True, db[key]
+            return False, None
+
+        def save(key, value):
+            db = open_shelf()
+            db[key] = value
+            db.sync()
+
+        def close():
+            nonlocal shelf
+            if shelf is not None:
+                shelf.close()
+                shelf = None
+                atexit.unregister(cache_close)
+
+        def cache_close():
+            io.submit(close).result()
+
+        if iscoroutinefunction(func):
+            @decorator(func)
+            async def wrapper(*args, **kwargs):
+                key = make_key(args, kwargs)
+                hit, value = await asyncio.wrap_future(io.submit(load, key))
+                if not hit:
+                    value = await func(*args, **kwargs)
+                    await asyncio.wrap_future(io.submit(save, key, value))
+                return value
+        else:
+            @decorator(func)
+            def wrapper(*args, **kwargs):
+                key = make_key(args, kwargs)
+                hit, value = io.submit(load, key).result()
+                if not hit:
+                    value = func(*args, **kwargs)
+                    io.submit(save, key, value).result()
+                return value
+        wrapper.cache_close = cache_close
+        return wrapper
+    return memoizer
+
+
+def _stable_repr(obj):
+    '''
+    Representation of call arguments that is the same in every process:
+    sets and dicts are sorted, so string hash randomization does not
+    change it. Raises TypeError for other types, whose repr may not be stable.
+    '''
+    if obj is None or isinstance(obj, (bool, int, float, str, bytes)):
+        return repr(obj)
+    if isinstance(obj, (tuple, list)):
+        return f"{type(obj).__name__}({', '.join(map(_stable_repr, obj))})"
+    if isinstance(obj, (set, frozenset)):
+        return f"{type(obj).__name__}({', '.join(sorted(map(_stable_repr, obj)))})"
+    if isinstance(obj, dict):
+        items = sorted(f"{_stable_repr(k)}: {_stable_repr(v)}" for k, v in obj.items())
+        return f"dict({', '.join(items)})"
+    raise TypeError(f"disk_memo cannot build a stable key from {type(obj).__name__}")
+
+
+class _SerialExecutor:
+    '''
+    Runs submitted calls one by one on a single daemon thread, so that
+    resources tied to a thread (e.g. sqlite-based dbm) always stay on it.
+    The thread is started on the first call and keeps running during atexit.
+    '''
+
+    def __init__(self, name):
+        self.name = name
+        self.jobs = queue.SimpleQueue()
+        self.thread = None
+        self.lock = threading.Lock()
+
+    def submit(self, fn, *args):
+        future = Future()
+        with self.lock:
+            if self.thread is None:
+                self.thread = threading.Thread(target=self.run, name=self.name, daemon=True)
+                self.thread.start()
+        self.jobs.put((future, fn, args))
+        return future
+
+    def run(self):
+        while True:
+            future, fn, args = self.jobs.get()
+            if not future.set_running_or_notify_cancel():
+                continue
+            try:
+                future.set_result(fn(*args))
+            except BaseException as exc:
+                future.set_exception(exc)
+
+
 def n_ary(func):
     '''
     Given binary function f(x, y), return an n_ary function such
@@ -69,15 +429,14 @@ def n_ary(func):
 
     @decorator(func)
     def wrapper(*args):
-        if len(args) == 1:
-            return args[0]
-        if len(args) == 2:
-            return func(*args)
-        return func(args[0], wrapper(*args[1:]))
+        res = args[-1]
+        for arg in args[-2::-1]:
+            res = func(arg, res)
+        return res
     return wrapper
 
 
-def trace(trace_spacer):
+def trace(trace_spacer, log=None):
     '''Trace calls made to function decorated.
 
     @trace("____")
@@ -96,26 +455,78 @@ def trace(trace_spacer):
     ____ <-- fib(1) == 1
      <-- fib(3) == 3
 
+    Indentation is tracked per task/thread. Output goes to the log
+    (by default buffered to stdout in background, see flush_trace).
+
     '''
 
+    default_log = log is None
+    if default_log:
+        log = _trace_log
+
     def tracer(func):
-        func.trace_spacer = ""
-        @decorator(func)
-        def wrapper(*args):
-            arg_str = ', '.join(list(map(str, args)))
-            spacer = wrapper.trace_spacer
-            print(f"{spacer} --> {func.__name__}({arg_str})")
-            spacer = spacer + trace_spacer
-            wrapper.trace_spacer = spacer
-            res = func(*args)
-            spacer = spacer[:-len(trace_spacer)]
-            wrapper.trace_spacer = spacer
-            print(f"{spacer} <-- {func.__name__}({arg_str}) == {res}")
-            return res
+        depth = contextvars.ContextVar(f"trace_depth_{func.__name__}", default=0)
+
+        def enter(args):
+            if default_log and not _trace_listener_started:
+                _start_trace_listener()
+            arg_str = ', '.join(map(str, args))
+            level = depth.get()
+            log.info(f"{trace_spacer * level} --> {func.__name__}({arg_str})")
+            return arg_str, level, depth.set(level + 1)
+
+        def leave(arg_str, level, res):
+            log.info(f"{trace_spacer * level} <-- {func.__name__}({arg_str}) == {res}")
+
+        if iscoroutinefunction(func):
+            @decorator(func)
+            async def wrapper(*args):
+                arg_str, level, token = enter(args)
+                try:
+                    res = await func(*args)
+                finally:
+                    depth.reset(token)
+                leave(arg_str, level, res)
+                return res
+        else:
+            @decorator(func)
+            def wrapper(*args):
+                arg_str, level, token = enter(args)
+                try:
+                    res = func(*args)
+                finally:
+                    depth.reset(token)
+                leave(arg_str, level, res)
+                return res
         return wrapper
     return tracer
 
 
+def _start_trace_listener():
+    global _trace_listener_started
+    with _trace_listener_lock:
+        if not _trace_listener_started:
+            _trace_listener.start()
+            _trace_listener_started = True
+
+
+def flush_trace():
+    '''Wait until all the buffered trace output is written.'''
+    with _trace_listener_lock:
+        if _trace_listener_started:
+            _trace_listener.stop()
+            _trace_listener.start()
+
+
+@atexit.register
+def _stop_trace_listener():
+    global _trace_listener_started
+    with _trace_listener_lock:
+        if _trace_listener_started:
+            _trace_listener.stop()
+            _trace_listener_started = False
+
+
 
 @memo
 @countcalls
@@ -155,8 +566,11 @@ def main():
 
 
     print(fib.__doc__)
-    print(fib(3))
+    res = fib(3)
+    flush_trace()
+    print(res)
     print(fib.calls, 'calls made')
+    print(fib.cache_info())
 
 
 if __name__ == '__main__':
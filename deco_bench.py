@@ -0,0 +1,60 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+# -----------------
+# Микробенчмарк накладных расходов декораторов из deco.py
+#
+# Для каждого декоратора замеряет время одного вызова задекорированной
+# функции и разницу с вызовом исходной функции.
+# -----------------
+
+import argparse
+import timeit
+
+import deco
+
+
+def add(a, b):
+    return a + b
+
+
+def make_cases():
+    """(название, функция, аргументы) для замера"""
+    many = tuple(range(5000))
+    return [
+        ("plain", add, (4, 3)),
+        ("disable", deco.disable(add), (4, 3)),
+        ("countcalls", deco.countcalls(add), (4, 3)),
+        ("memo (hit)", deco.memo(add), (4, 3)),
+        ("memo(maxsize=128) (hit)", deco.memo(maxsize=128)(add), (4, 3)),
+        ("n_ary (2 args)", deco.n_ary(add), (4, 3)),
+        ("countcalls+memo+n_ary", deco.countcalls(deco.memo(deco.n_ary(add))), (4, 3)),
+        ("n_ary (5000 args)", deco.n_ary(add), many),
+    ]
+
+
+def measure(func, args, number):
+    """Среднее время одного вызова func(*args) в наносекундах"""
+    timer = timeit.Timer(lambda: func(*args))
+    return min(timer.repeat(repeat=5, number=number)) / number * 1e9
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="deco.py per-call overhead")
+    parser.add_argument("-n", "--number", type=int, default=200000,
+                        help="calls per measurement")
+    return parser.parse_args()
+
+
+def main():
+    args = parse_args()
+    cases = make_cases()
+    plain = measure(add, (4, 3), args.number)
+    for name, func, func_args in cases:
+        number = args.number if len(func_args) < 100 else max(args.number // 1000, 1)
+        ns = measure(func, func_args, number)
+        print(f"{name:<28} {ns:12.1f} ns/call {ns - plain:+12.1f} ns overhead")
+
+
+if __name__ == '__main__':
+    main()
@@ -2,6 +2,7 @@
 # -*- coding: utf-8 -*-
 
 import itertools
+from functools import lru_cache
 
 # -----------------
 # Реализуйте функцию best_hand, которая принимает на вход
@@ -30,16 +31,61 @@ import itertools
 # -----------------
 
 
+RANKS = "23456789TJQKA"
+SUITS = "CSHD"
+
+# Карта кодируется одним int: старшие биты - ранг (2..14), младшие 2 бита - масть
+RANK_VALUES = {rank: value for value, rank in enumerate(RANKS, 2)}
+CARD_CODES = {rank + suit: (value << 2) | suit_code
+              for rank, value in RANK_VALUES.items()
+              for suit_code, suit in enumerate(SUITS)}
+CARD_NAMES = {code: card for card, code in CARD_CODES.items()}
+
+JOKER_DECKS = {
+    "?R": [rank + suit for suit in "HD" for rank in RANKS],
+    "?B": [rank + suit for suit in "CS" for rank in RANKS],
+}
+
+# Различных канонических рук из 5 карт 7462, кэш вмещает их все
+RANK_CACHE_SIZE = 8192
+
+
+def hand_key(codes):
+    """Каноническая форма руки по кодам карт, инвариантная к перестановке мастей:
+    ранги по убыванию и признак флеша. Больше ничего hand_rank не использует"""
+    return card_ranks(codes), flush(codes)
+
+
+def parse_hand(hand):
+    """Коды карт 'руки'"""
+    return [CARD_CODES[card] for card in hand]
+
+
+def card_names(codes):
+    """Карты 'руки' по их кодам"""
+    return [CARD_NAMES[code] for code in codes]
+
+
 def hand_rank(hand):
     """Возвращает значение определяющее ранг 'руки'"""
-    ranks = card_ranks(hand)
-    if straight(ranks) and flush(hand):
+    rank = canonical_rank(*hand_key(parse_hand(hand)))
+    if rank[0] in (0, 1, 2, 3, 5):
+        # в кэше ранги хранятся кортежем, наружу отдаем список, как раньше
+        return rank[:-1] + (list(rank[-1]),)
+    return rank
+
+
+@lru_cache(maxsize=RANK_CACHE_SIZE)
+def canonical_rank(ranks, is_flush):
+    """Ранг руки по ее канонической форме (см. hand_key).
+    Результат кэшируется, поэтому ранги в нем возвращаются кортежами"""
+    if straight(ranks) and is_flush:
         return (8, max(ranks))
     elif kind(4, ranks):
         return (7, kind(4, ranks), kind(1, ranks))
     elif kind(3, ranks) and kind(2, ranks):
         return (6, kind(3, ranks), kind(2, ranks))
-    elif flush(hand):
+    elif is_flush:
         return (5, ranks)
     elif straight(ranks):
         return (4, max(ranks))
@@ -53,30 +99,15 @@ def hand_rank(hand):
         return (0, ranks)
 
 
-def card_ranks(hand):
-    """Возвращает список рангов (его числовой эквивалент),
+def card_ranks(codes):
+    """Возвращает кортеж рангов карт по их кодам,
     отсортированный от большего к меньшему"""
+    return tuple(sorted([code >> 2 for code in codes], reverse=True))
 
-    rank_dict = {
-        "T": 10,
-        "J": 11,
-        "Q": 12,
-        "K": 13,
-        "A": 14
-    }
-    ranks = []
-    for card in hand:
-        if card[0].isdigit():
-            ranks.append(int(card[0]))
-        else:
-            ranks.append(rank_dict[card[0]])
-    ranks.sort(reverse=True)
-    return ranks
-
-
-def flush(hand):
-    """Возвращает True, если все карты одной масти"""
-    return all_equal([card[1] for card in hand])
+
+def flush(codes):
+    """Возвращает True, если все карты (по кодам) одной масти"""
+    return len({code & 3 for code in codes}) == 1
 
 def straight(ranks):
     """Возвращает True, если отсортированные ранги формируют последовательность 5ти,
@@ -121,18 +152,6 @@ def two_pair(ranks):
     return None
 
 
-def compare_hand_rank(rank1, rank2):
-    for x,y in zip(rank1, rank2):
-        if isinstance(x, list):
-            if compare_hand_rank(x, y):
-                return True
-        elif x < y:
-            return False
-        elif x > y:
-            return True
-    return False
-
-
 def all_equal(iterable):
     "Returns True if all the elements are equal to each other"
     g = itertools.groupby(iterable)
@@ -141,16 +160,12 @@ def all_equal(iterable):
 
 def best_hand(hand):
     """Из "руки" в 7 карт возвращает лучшую "руку" в 5 карт """
+    return card_names(max(get_hand5(parse_hand(hand)), key=rank_codes))
+
 
-    all_hand5 = get_hand5(hand)
-    best_rank = [0]
-    best_hand = None
-    for hand5 in all_hand5:
-        rank = hand_rank(hand5)
-        if compare_hand_rank(rank, best_rank):
-            best_rank = rank
-            best_hand = hand5
-    return best_hand
+def rank_codes(codes):
+    """hand_rank для уже разобранных кодов карт"""
+    return canonical_rank(*hand_key(codes))
 
 
 def get_hand5(hand):
@@ -158,26 +173,9 @@ def get_hand5(hand):
     return itertools.combinations(hand, 5)
 
 
-def get_hand5_with_joker(hand):
-    """получает все варианты руки из 7 карт с замененными джокерами и возвращает комбинации по 5 карт"""
-    for new_hand in get_replaced_jokers_hands(hand):
-        for hand5 in get_hand5(new_hand):
-            yield hand5
-
-
 def get_joker_deck(hand, joker):
     """карты, на которые может замениться джокер"""
-    ranks = ["2", "3", "4", "5", "6", "7", "8", "9", "T", "J", "Q", "K", "A"]
-    red_suits = ["H", "D"]
-    black_suits = ["C", "S"]
-
-    if joker[1] == "R":
-        suits = red_suits
-    else:
-        suits = black_suits
-
-    joker_deck = filter(lambda card: False if card in hand else True, [rank + suit for suit in suits for rank in ranks])
-    return joker_deck
+    return [card for card in JOKER_DECKS[joker] if card not in hand]
 
 
 def replace_joker(hand, joker):
@@ -201,16 +199,10 @@ def get_replaced_jokers_hands(hand):
 def best_wild_hand(hand):
     """best_hand но с джокерами"""
 
-    all_hand5 = get_hand5_with_joker(hand)
-
-    best_rank = [0]
-    best_hand = None
-    for hand5 in all_hand5:
-        rank = hand_rank(hand5)
-        if compare_hand_rank(rank, best_rank):
-            best_rank = rank
-            best_hand = hand5
-    return best_hand
+    all_hand5 = (hand5
+                 for new_hand in get_replaced_jokers_hands(hand)
+                 for hand5 in get_hand5(parse_hand(new_hand)))
+    return card_names(max(all_hand5, key=rank_codes))
 
 
 def test_best_hand():
@@ -221,6 +213,9 @@ def test_best_hand():
             == ['8C', '8S', 'TC', 'TD', 'TH'])
     assert (sorted(best_hand("JD TC TH 7C 7D 7S 7H".split()))
             == ['7C', '7D', '7H', '7S', 'JD'])
+    assert (sorted(best_hand("2C 4D 6H 8S TC QD AH".split()))
+            == ['6H', '8S', 'AH', 'QD', 'TC'])
+    assert hand_rank("2C 3C 4C 5C 7C".split()) == hand_rank("2H 3H 4H 5H 7H".split())
     print('OK')
 
 
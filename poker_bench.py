@@ -0,0 +1,221 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+# -----------------
+# Бенчмарк и проверка корректности для poker.py
+#
+# Замеряет скорость (рук в секунду) hand_rank, best_hand и best_wild_hand
+# на случайных руках с фиксированным seed и hand_rank на всех 2 598 960
+# руках из 5 карт. В режиме проверки сравнивает выбранную функцию оценки
+# с эталонной реализацией на каждой руке из 5 карт и сверяет частоты
+# категорий рук.
+# -----------------
+
+import argparse
+import importlib
+import itertools
+import random
+import time
+
+import poker
+
+FULL_DECK = [rank + suit for rank in "23456789TJQKA" for suit in "CSHD"]
+JOKERS = ["?R", "?B"]
+
+# Эталонные частоты категорий среди всех рук из 5 карт.
+# Стрит от туза до пятерки (A-2-3-4-5) в poker.py стритом не считается,
+# поэтому стрит-флешей 36, а не 40, и стритов 9180, а не 10200
+CATEGORY_FREQUENCIES = {
+    8: 36,
+    7: 624,
+    6: 3744,
+    5: 5112,
+    4: 9180,
+    3: 54912,
+    2: 123552,
+    1: 1098240,
+    0: 1303560,
+}
+
+
+# Эталон - замороженная копия исходных функций poker.py, не зависящая
+# от текущей реализации, чтобы ошибка в общих функциях не прошла незамеченной
+
+REFERENCE_RANKS = {
+    "T": 10,
+    "J": 11,
+    "Q": 12,
+    "K": 13,
+    "A": 14
+}
+
+
+def reference_card_ranks(hand):
+    ranks = []
+    for card in hand:
+        if card[0].isdigit():
+            ranks.append(int(card[0]))
+        else:
+            ranks.append(REFERENCE_RANKS[card[0]])
+    ranks.sort(reverse=True)
+    return ranks
+
+
+def reference_all_equal(iterable):
+    g = itertools.groupby(iterable)
+    return next(g, True) and not next(g, False)
+
+
+def reference_flush(hand):
+    return reference_all_equal([card[1] for card in hand])
+
+
+def reference_straight(ranks):
+    cur_rank = None
+    for rank in ranks:
+        if cur_rank and cur_rank != (rank + 1):
+            return False
+        cur_rank = rank
+    return True
+
+
+def reference_kind(n, ranks):
+    for rank_n in itertools.combinations(ranks, n):
+        if reference_all_equal(rank_n):
+            rank_n1 = reference_kind(n + 1, ranks)
+            if not rank_n1 or rank_n1 != rank_n[0]:
+                return rank_n[0]
+    return None
+
+
+def reference_two_pair(ranks):
+    rank1 = None
+    for rank_2 in itertools.combinations(ranks, 2):
+        if reference_all_equal(rank_2):
+            if not rank1:
+                rank1 = rank_2[0]
+            else:
+                return rank1, rank_2[0]
+    return None
+
+
+def reference_hand_rank(hand):
+    """Эталонная реализация hand_rank без кодирования карт и кэша"""
+    ranks = reference_card_ranks(hand)
+    kind = reference_kind
+    if reference_straight(ranks) and reference_flush(hand):
+        return (8, max(ranks))
+    elif kind(4, ranks):
+        return (7, kind(4, ranks), kind(1, ranks))
+    elif kind(3, ranks) and kind(2, ranks):
+        return (6, kind(3, ranks), kind(2, ranks))
+    elif reference_flush(hand):
+        return (5, ranks)
+    elif reference_straight(ranks):
+        return (4, max(ranks))
+    elif kind(3, ranks):
+        return (3, kind(3, ranks), ranks)
+    elif reference_two_pair(ranks):
+        return (2, reference_two_pair(ranks), ranks)
+    elif kind(2, ranks):
+        return (1, kind(2, ranks), ranks)
+    else:
+        return (0, ranks)
+
+
+def normalize_rank(rank):
+    """Приводит ранг к виду, не зависящему от list/tuple внутри"""
+    return tuple(tuple(x) if isinstance(x, (list, tuple)) else x for x in rank)
+
+
+def load_evaluator(path):
+    """Загружает функцию оценки по строке вида 'module:function'"""
+    module_name, func_name = path.split(":")
+    return getattr(importlib.import_module(module_name), func_name)
+
+
+def all_hands5():
+    """Все руки из 5 карт"""
+    return itertools.combinations(FULL_DECK, 5)
+
+
+def random_hands(n, size, seed, jokers=False):
+    """n случайных рук по size карт из колоды (при jokers=True - с джокерами)"""
+    rnd = random.Random(seed)
+    deck = FULL_DECK + JOKERS if jokers else FULL_DECK
+    return [rnd.sample(deck, size) for _ in range(n)]
+
+
+def measure(func, hands):
+    """Прогоняет func по всем рукам, возвращает (число рук, секунды)"""
+    count = 0
+    start = time.perf_counter()
+    for hand in hands:
+        func(hand)
+        count += 1
+    return count, time.perf_counter() - start
+
+
+def report(name, count, elapsed):
+    rate = count / elapsed if elapsed else float("inf")
+    print(f"{name:<28} {count:>9} hands {elapsed:9.3f} s {rate:14.0f} hands/s")
+
+
+def run_benchmarks(evaluator, n, seed, full=False):
+    poker.canonical_rank.cache_clear()
+    report("hand_rank (random 5)", *measure(evaluator, random_hands(n, 5, seed)))
+    report("best_hand (random 7)", *measure(poker.best_hand, random_hands(n, 7, seed)))
+    report("best_wild_hand (random 7)",
+           *measure(poker.best_wild_hand, random_hands(max(n // 100, 1), 7, seed, jokers=True)))
+    if full:
+        report("hand_rank (all 5)", *measure(evaluator, all_hands5()))
+
+
+def verify(evaluator, reference=reference_hand_rank, hands=None):
+    """Сравнивает evaluator с эталоном на каждой руке и сверяет частоты категорий.
+    Возвращает список найденных расхождений"""
+    if hands is None:
+        hands = all_hands5()
+    errors = []
+    frequencies = dict.fromkeys(CATEGORY_FREQUENCIES, 0)
+    for hand in hands:
+        rank = normalize_rank(evaluator(hand))
+        expected = normalize_rank(reference(hand))
+        if rank != expected:
+            errors.append(f"{' '.join(hand)}: {rank} != {expected}")
+        frequencies[rank[0]] = frequencies.get(rank[0], 0) + 1
+    for category, expected in CATEGORY_FREQUENCIES.items():
+        if frequencies[category] != expected:
+            errors.append(f"category {category}: {frequencies[category]} hands, expected {expected}")
+    return errors
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="poker.py benchmarks")
+    parser.add_argument("-e", "--evaluator", default="poker:hand_rank",
+                        help="hand evaluator as module:function")
+    parser.add_argument("-n", "--hands", type=int, default=100000,
+                        help="number of random hands")
+    parser.add_argument("-s", "--seed", type=int, default=1)
+    parser.add_argument("--full", action="store_true",
+                        help="also time hand_rank over all 5-card hands")
+    parser.add_argument("--verify", action="store_true",
+                        help="check evaluator against the reference on all 5-card hands")
+    return parser.parse_args()
+
+
+def main():
+    args = parse_args()
+    evaluator = load_evaluator(args.evaluator)
+    if args.verify:
+        errors = verify(evaluator)
+        for error in errors[:20]:
+            print(error)
+        print(f"{len(errors)} errors")
+        return 1 if errors else 0
+    run_benchmarks(evaluator, args.hands, args.seed, args.full)
+    return 0
+
+
+if __name__ == '__main__':
+    raise SystemExit(main())
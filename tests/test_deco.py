@@ -0,0 +1,355 @@
+import unittest
+import env
+
+import deco
+import asyncio
+import json
+import logging
+import os
+import os.path
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from unittest import mock
+
+
+class Test_memo(unittest.TestCase):
+
+    def setUp(self):
+        self.calls = []
+
+    def make(self, **options):
+        @deco.memo(**options)
+        def f(x, y=0):
+            self.calls.append((x, y))
+            return x + y
+        return f
+
+    def test_bare(self):
+        @deco.memo
+        def f(x):
+            self.calls.append(x)
+            return x
+
+        self.assertEqual(f(1), 1)
+        self.assertEqual(f(1), 1)
+        self.assertEqual(self.calls, [1])
+        self.assertEqual(f([1]), [1])
+        self.assertEqual(f.cache_info(), deco.CacheInfo(1, 1, None, 1))
+
+    def test_kwargs(self):
+        f = self.make()
+        self.assertEqual(f(1, y=2), 3)
+        self.assertEqual(f(1, y=2), 3)
+        self.assertEqual(f(1), 1)
+        self.assertEqual(self.calls, [(1, 2), (1, 0)])
+
+    def test_positional_options(self):
+        with self.assertRaises(TypeError):
+            deco.memo(128)
+
+    def test_lru(self):
+        f = self.make(maxsize=2)
+        f(1)
+        f(2)
+        f(1)
+        f(3)  # вытесняет 2
+        f(1)
+        f(2)
+        self.assertEqual([x for x, _ in self.calls], [1, 2, 3, 2])
+        self.assertEqual(f.cache_info().currsize, 2)
+
+    def test_lfu(self):
+        f = self.make(maxsize=2, policy="lfu")
+        for _ in range(3):
+            f(1)
+            f(2)
+        for _ in range(5):
+            f(3)
+        self.assertEqual([x for x, _ in self.calls], [1, 2, 3])
+        f(2)  # 1 был вытеснен при добавлении 3, 2 остался
+        f(1)
+        self.assertEqual([x for x, _ in self.calls], [1, 2, 3, 1])
+
+    def test_ttl(self):
+        now = [100.0]
+        with mock.patch("deco._clock", lambda: now[0]):
+            f = self.make(ttl=10)
+            f(1)
+            now[0] += 5
+            f(1)
+            self.assertEqual(len(self.calls), 1)
+            now[0] += 5
+            f(1)
+            self.assertEqual(len(self.calls), 2)
+
+            for x in range(1000):
+                f(x)
+                now[0] += 1
+            self.assertLessEqual(f.cache_info().currsize, 11)
+
+    def test_cache_clear(self):
+        f = self.make()
+        f(1)
+        f(1)
+        f.cache_clear()
+        self.assertEqual(f.cache_info(), deco.CacheInfo(0, 0, None, 0))
+        f(1)
+        self.assertEqual(len(self.calls), 2)
+
+    def test_threads(self):
+        @deco.memo
+        def slow(x):
+            self.calls.append(x)
+            time.sleep(0.05)
+            return x
+
+        threads = [threading.Thread(target=slow, args=(1,)) for _ in range(8)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        self.assertEqual(self.calls, [1])
+        self.assertEqual(slow.cache_info().misses, 1)
+
+    def test_threads_after_error(self):
+        active = []
+        overlaps = []
+        guard = threading.Lock()
+
+        @deco.memo
+        def flaky(x):
+            with guard:
+                active.append(x)
+                if len(active) > 1:
+                    overlaps.append(len(active))
+            time.sleep(0.02)
+            with guard:
+                active.remove(x)
+                self.calls.append(x)
+                if len(self.calls) == 1:
+                    raise ValueError(x)
+            return x
+
+        def run():
+            try:
+                flaky(1)
+            except ValueError:
+                pass
+
+        threads = [threading.Thread(target=run) for _ in range(8)]
+        for thread in threads:
+            thread.start()
+            time.sleep(0.005)
+        for thread in threads:
+            thread.join()
+        self.assertEqual(overlaps, [])
+        self.assertEqual(self.calls, [1, 1])
+
+
+class Test_disable(unittest.TestCase):
+
+    def test(self):
+        def f(x):
+            return x
+
+        self.assertIs(deco.disable(f), f)
+        self.assertIs(deco.disable(maxsize=128, ttl=1)(f), f)
+
+
+class Test_n_ary(unittest.TestCase):
+
+    def test(self):
+        f = deco.n_ary(lambda x, y: (x, y))
+        self.assertEqual(f(1), 1)
+        self.assertEqual(f(1, 2, 3), (1, (2, 3)))
+        self.assertEqual(deco.n_ary(lambda x, y: x + y)(*range(5000)), sum(range(5000)))
+
+
+class Test_countcalls(unittest.TestCase):
+
+    def test_threads(self):
+        f = deco.countcalls(lambda: None)
+
+        def run():
+            for _ in range(1000):
+                f()
+
+        threads = [threading.Thread(target=run) for _ in range(4)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        self.assertEqual(f.calls, 4000)
+        self.assertEqual(str(f.calls), "4000")
+
+    def test_reset(self):
+        f = deco.countcalls(lambda: None)
+        f()
+        f()
+        self.assertEqual(f.calls + 1, 3)
+        self.assertEqual(json.dumps(f.calls), "2")
+        f.calls = 0
+        f()
+        self.assertEqual(f.calls, 1)
+
+    def test_async(self):
+        @deco.countcalls
+        async def f(x):
+            return x
+
+        async def run():
+            return await asyncio.gather(*[f(x) for x in range(5)])
+
+        self.assertEqual(asyncio.run(run()), list(range(5)))
+        self.assertEqual(f.calls, 5)
+
+
+class Test_async_memo(unittest.TestCase):
+
+    def test_coalesce(self):
+        calls = []
+
+        @deco.memo
+        async def slow(x):
+            calls.append(x)
+            await asyncio.sleep(0.05)
+            return x * 2
+
+        async def run():
+            return await asyncio.gather(*[slow(3) for _ in range(10)])
+
+        self.assertEqual(asyncio.run(run()), [6] * 10)
+        self.assertEqual(calls, [3])
+        self.assertEqual(slow.cache_info(), deco.CacheInfo(9, 1, None, 1))
+
+
+class ListHandler(logging.Handler):
+
+    def __init__(self):
+        super().__init__()
+        self.lines = []
+
+    def emit(self, record):
+        self.lines.append(record.getMessage())
+
+
+class Test_trace(unittest.TestCase):
+
+    def setUp(self):
+        self.handler = ListHandler()
+        self.log = logging.getLogger("test_deco.trace")
+        self.log.addHandler(self.handler)
+        self.log.setLevel(logging.INFO)
+        self.log.propagate = False
+
+    def tearDown(self):
+        self.log.removeHandler(self.handler)
+
+    def test_tasks(self):
+        @deco.trace("..", log=self.log)
+        async def fib(n):
+            await asyncio.sleep(0)
+            return 1 if n <= 1 else await fib(n - 1) + await fib(n - 2)
+
+        async def run():
+            return await asyncio.gather(fib(2), fib(2))
+
+        self.assertEqual(asyncio.run(run()), [2, 2])
+        self.assertEqual(sorted(self.handler.lines), sorted([
+            " --> fib(2)", ".. --> fib(1)", ".. <-- fib(1) == 1",
+            ".. --> fib(0)", ".. <-- fib(0) == 1", " <-- fib(2) == 2",
+        ] * 2))
+
+    def test_exception(self):
+        @deco.trace("__", log=self.log)
+        def boom(n):
+            if n:
+                raise ValueError(n)
+            return n
+
+        with self.assertRaises(ValueError):
+            boom(1)
+        boom(0)
+        self.assertEqual(self.handler.lines, [" --> boom(1)", " --> boom(0)", " <-- boom(0) == 0"])
+
+
+class Test_disk_memo(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.filename = os.path.join(self.tmp.name, "cache")
+        self.calls = []
+
+    def tearDown(self):
+        self.tmp.cleanup()
+
+    def make(self):
+        @deco.disk_memo(self.filename)
+        def square(x):
+            self.calls.append(x)
+            return x * x
+        return square
+
+    def test_persistence(self):
+        square = self.make()
+        self.assertEqual(square(4), 16)
+        self.assertEqual(square(4), 16)
+        square.cache_close()
+
+        square = self.make()
+        self.assertEqual(square(4), 16)
+        self.assertEqual(square(5), 25)
+        square.cache_close()
+        self.assertEqual(self.calls, [4, 5])
+
+    def test_async(self):
+        @deco.disk_memo(self.filename)
+        async def square(x):
+            self.calls.append(x)
+            return x * x
+
+        async def run():
+            return [await square(3), await square(3)]
+
+        self.assertEqual(asyncio.run(run()), [9, 9])
+        square.cache_close()
+        self.assertEqual(self.calls, [3])
+
+    def test_io_thread(self):
+        threads = set()
+        shelve_open = deco.shelve.open
+
+        def open_shelf(*args, **kwargs):
+            threads.add(threading.get_ident())
+            return shelve_open(*args, **kwargs)
+
+        square = self.make()
+        with mock.patch("deco.shelve.open", open_shelf):
+            square(2)
+            square.cache_close()
+            asyncio.run(asyncio.to_thread(square, 2))
+            square.cache_close()
+        self.assertEqual(len(threads), 1)
+        self.assertNotIn(threading.get_ident(), threads)
+
+    def test_unstable_arguments(self):
+        square = self.make()
+        with self.assertRaises(TypeError):
+            square(object())
+        square.cache_close()
+
+    def test_stable_key(self):
+        code = "import deco; print(deco._stable_repr(({'b': frozenset('xyz')}, {'a', 'b', 'c'})))"
+        root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+        outputs = set()
+        for seed in ("1", "2", "3"):
+            env_vars = dict(os.environ, PYTHONHASHSEED=seed)
+            outputs.add(subprocess.check_output([sys.executable, "-c", code], cwd=root, env=env_vars))
+        self.assertEqual(len(outputs), 1)
+
+
+if __name__ == '__main__':
+    unittest.main()